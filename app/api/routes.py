@@ -1,43 +1,77 @@
+import asyncio
 import json
-import os
-import tempfile
+import time
 
+import aiofiles.os
+import aiofiles.tempfile
 import aiohttp
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
-from langchain_community.document_loaders import PyPDFLoader
+from fastapi import APIRouter, Depends, File, HTTPException, Request, UploadFile
 
 from app.config import get_settings
 from app.models.schemas import DocumentMetadata
 from app.pipeline.pdf_pipeline import PDFAnalysisPipeline
-from app.util.llm_provider import LLMFactory, LLMProvider
+from app.util.llm_provider import LLMProvider
+from app.util.pdf_loader import load_pdf
 
 router = APIRouter()
 
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Last LLM health check; a success is reused for HEALTH_CACHE_TTL seconds
+_llm_health = {"timestamp": 0.0, "response": None, "error": None}
+# Only one probe at a time refreshes the check, concurrent probes share its result
+_llm_health_lock = asyncio.Lock()
+
+
+def get_llm_provider(request: Request) -> LLMProvider:
+    return request.app.state.llm_provider
 
-def get_llm_provider() -> LLMProvider:
-    return LLMFactory.create_provider(
-        "ollama", get_settings().OLLAMA_BASE_URL, get_settings().OLLAMA_MODEL
-    )
+
+def get_pipeline(request: Request) -> PDFAnalysisPipeline:
+    return request.app.state.pipeline
 
 
 @router.get("/health")
 async def health_check(llm_provider: LLMProvider = Depends(get_llm_provider)):
     """Basic health check that also verifies LLM connection."""
-    try:
-        response = await llm_provider.generate("Test connection")
+    if not _llm_health_fresh():
+        requested_at = time.monotonic()
+        async with _llm_health_lock:
+            # Skip the LLM call if another probe finished a check while we waited
+            if _llm_health["timestamp"] < requested_at and not _llm_health_fresh():
+                try:
+                    response = await llm_provider.generate("Test connection")
+                    _llm_health.update(response=response, error=None)
+                except Exception as e:
+                    _llm_health.update(response=None, error=str(e))
+                _llm_health["timestamp"] = time.monotonic()
+
+    if _llm_health["error"] is not None:
         return {
             "status": "healthy",
-            "llm_status": "connected",
-            "llm_response": response,
+            "llm_status": "error",
+            "llm_error": _llm_health["error"],
         }
-    except Exception as e:
-        return {"status": "healthy", "llm_status": "error", "llm_error": str(e)}
+    return {
+        "status": "healthy",
+        "llm_status": "connected",
+        "llm_response": _llm_health["response"],
+    }
+
+
+def _llm_health_fresh() -> bool:
+    return (
+        _llm_health["response"] is not None
+        and time.monotonic() - _llm_health["timestamp"]
+        < get_settings().HEALTH_CACHE_TTL
+    )
 
 
 @router.post("/input", response_model=DocumentMetadata)
 async def process_document(
+    request: Request,
     file: UploadFile = File(...),
-    llm_provider: LLMProvider = Depends(get_llm_provider),
+    pipeline: PDFAnalysisPipeline = Depends(get_pipeline),
 ):
     """
     Process a PDF document and forward the results to the backend service.
@@ -46,53 +80,74 @@ async def process_document(
     if not file.filename.endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
 
+    max_bytes = get_settings().MAX_PDF_BYTES
+    content_length = request.headers.get("content-length")
+    if (content_length is not None and int(content_length) > max_bytes) or (
+        file.size is not None and file.size > max_bytes
+    ):
+        raise HTTPException(
+            status_code=413, detail=f"PDF files may not exceed {max_bytes} bytes"
+        )
+
+    # PDF readers accept the header anywhere in the first 1024 bytes
+    header = await file.read(1024)
+    if b"%PDF-" not in header:
+        raise HTTPException(status_code=400, detail="File is not a valid PDF")
+    await file.seek(0)
+
+    tmp_path = None
     try:
         # Create a temporary file to store the uploaded document
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_file.flush()
-
-            # Load the PDF and split it into pages
-            loader = PyPDFLoader(tmp_file.name)
-            pages = loader.load_and_split()
-
-            # Process the document with the analysis pipeline
-            pipeline = PDFAnalysisPipeline(llm_provider)
-            document_metadata = await pipeline.process_document(pages)
-
-            backend_url = f"{get_settings().BACKEND_BASE_URL}/modules/input"
-            json_payload = {
-                "title": document_metadata.title,
-                "tags": document_metadata.tags,
-                "short": document_metadata.short_summary,
-                "transcription": document_metadata.summary,
-            }
-
-            # Send multipart request to backend
-            async with aiohttp.ClientSession() as session:
-                form = aiohttp.FormData()
-                form.add_field(
-                    "json", json.dumps(json_payload), content_type="application/json"
-                )
-                await file.seek(0)
-                form.add_field(
-                    "file",
-                    await file.read(),
-                    filename=file.filename,
-                    content_type=file.content_type,
-                )
-
-                async with session.post(backend_url, data=form) as response:
-                    if response.status >= 400:
-                        raise HTTPException(
-                            status_code=response.status,
-                            detail=f"Backend service error: {await response.text()}",
-                        )
-                    pass
-
-            return document_metadata
+        async with aiofiles.tempfile.NamedTemporaryFile(
+            "wb", delete=False, suffix=".pdf"
+        ) as tmp_file:
+            tmp_path = tmp_file.name
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await tmp_file.write(chunk)
+
+        # Load the PDF and split it into pages
+        pages = await asyncio.to_thread(load_pdf, tmp_path)
+
+        # Process the document with the analysis pipeline
+        document_metadata = await pipeline.process_document(
+            pages, request.app.state.split_pool
+        )
+
+        backend_url = f"{get_settings().BACKEND_BASE_URL}/modules/input"
+        json_payload = {
+            "title": document_metadata.title,
+            "tags": document_metadata.tags,
+            "short": document_metadata.short_summary,
+            "transcription": document_metadata.summary,
+        }
 
+        # Send multipart request to backend
+        # Stream the spooled file instead of reading the upload into memory again
+        with open(tmp_path, "rb") as upload:
+            form = aiohttp.FormData()
+            form.add_field(
+                "json", json.dumps(json_payload), content_type="application/json"
+            )
+            form.add_field(
+                "file",
+                upload,
+                filename=file.filename,
+                content_type=file.content_type,
+            )
+
+            session: aiohttp.ClientSession = request.app.state.http
+            async with session.post(backend_url, data=form) as response:
+                if response.status >= 400:
+                    raise HTTPException(
+                        status_code=response.status,
+                        detail=f"Backend service error: {await response.text()}",
+                    )
+                pass
+
+        return document_metadata
+
+    except HTTPException:
+        raise
     except aiohttp.ClientError as e:
         raise HTTPException(
             status_code=502,
@@ -103,8 +158,9 @@ async def process_document(
 
     finally:
         # Ensure the temporary file is deleted
-        try:
-            os.unlink(tmp_file.name)
-        except Exception as e:
-            # Log or handle any issues with file deletion if necessary
-            print(f"Warning: Failed to delete temporary file {tmp_file.name}: {str(e)}")
+        if tmp_path is not None:
+            try:
+                await aiofiles.os.remove(tmp_path)
+            except Exception as e:
+                # Log or handle any issues with file deletion if necessary
+                print(f"Warning: Failed to delete temporary file {tmp_path}: {str(e)}")
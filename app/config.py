@@ -6,7 +6,18 @@ from pydantic_settings import BaseSettings
 class Settings(BaseSettings):
     OLLAMA_BASE_URL: str = "http://localhost:11434"
     OLLAMA_MODEL: str = "llama3.1"
+    OLLAMA_EMBED_BATCH: int = 32
+    OLLAMA_EMBED_TIMEOUT: int = 60
     BACKEND_BASE_URL: str = "http://localhost:8000"
+    EMBEDDING_CACHE_DIR: str = "emb_cache"
+    EMBEDDING_CACHE_MAX_BYTES: int = 1024 * 1024 * 1024
+    LLM_CACHE_PATH: str = "llm_cache.sqlite3"
+    LLM_CACHE_THRESHOLD: float = 0.05
+    LLM_CACHE_MAX_ENTRIES: int = 1000
+    LLM_CACHE_MAX_CHARS: int = 6000
+    SMALL_DOCUMENT_CHUNKS: int = 5
+    HEALTH_CACHE_TTL: int = 10
+    MAX_PDF_BYTES: int = 100 * 1024 * 1024
 
     class Config:
         env_file = ".env"
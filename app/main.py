@@ -1,8 +1,54 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+
+import aiohttp
 from fastapi import FastAPI
 
 from app.api.routes import router
+from app.config import get_settings
+from app.pipeline.pdf_pipeline import PDFAnalysisPipeline
+from app.util.embeddings import BatchedOllamaEmbeddings
+from app.util.llm_cache import SemanticLLMCache
+from app.util.llm_provider import LLMFactory
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = get_settings()
+    # Build the LLM clients, cache and pipeline once and share them across requests
+    app.state.llm_provider = LLMFactory.create_provider(
+        "ollama", settings.OLLAMA_BASE_URL, settings.OLLAMA_MODEL
+    )
+    llm_cache = SemanticLLMCache(
+        BatchedOllamaEmbeddings(
+            base_url=settings.OLLAMA_BASE_URL,
+            model=settings.OLLAMA_MODEL,
+            batch_size=settings.OLLAMA_EMBED_BATCH,
+            client_kwargs={"timeout": settings.OLLAMA_EMBED_TIMEOUT},
+        ),
+        path=settings.LLM_CACHE_PATH,
+        namespace=settings.OLLAMA_MODEL,
+        threshold=settings.LLM_CACHE_THRESHOLD,
+        max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+        max_chars=settings.LLM_CACHE_MAX_CHARS,
+    )
+    app.state.pipeline = PDFAnalysisPipeline(app.state.llm_provider, llm_cache)
+
+    # Share one connection pool to the backend across all requests
+    app.state.http = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=100, keepalive_timeout=60)
+    )
+    # Spawned workers avoid forking the threads of the running server
+    app.state.split_pool = ProcessPoolExecutor(
+        mp_context=multiprocessing.get_context("spawn")
+    )
+    yield
+    await app.state.http.close()
+    app.state.split_pool.shutdown()
+
 
-app = FastAPI(title="Document Processing API")
+app = FastAPI(title="Document Processing API", lifespan=lifespan)
 app.include_router(router)
 
 if __name__ == "__main__":
@@ -1,54 +1,180 @@
+import asyncio
+import hashlib
+import itertools
 import re
-from typing import List
+from concurrent.futures import Executor
+from typing import List, Optional
 
+import faiss
+import numpy as np
 from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_ollama import OllamaEmbeddings
 
+from app.config import get_settings
 from app.models.schemas import DocumentMetadata
+from app.util.embeddings import BatchedOllamaEmbeddings, CachedEmbeddings
+from app.util.llm_cache import SemanticLLMCache
 from app.util.llm_provider import LLMProvider
 
+TEXT_SPLITTER = RecursiveCharacterTextSplitter(
+    chunk_size=1000,
+    chunk_overlap=200,
+    length_function=len,
+    separators=["\n\n", "\n", ". ", " ", ""],
+)
+
+# Documents with more pages than this are split in a process pool
+PARALLEL_SPLIT_MIN_PAGES = 50
+
 
 class PDFAnalysisPipeline:
-    def __init__(self, llm_provider: LLMProvider):
+    # Retrieval query and number of chunks for the title, summary, short summary and tags
+    RETRIEVAL_QUERIES = [
+        ("Was ist der Haupttitel oder das Hauptthema dieses Dokuments?", 2),
+        ("Was sind die wichtigsten Inhalte und Hauptpunkte des Dokuments?", 5),
+        ("Was sind die absolut wichtigsten Kernaussagen?", 3),
+        ("Was sind die Hauptthemen und -inhalte?", 3),
+    ]
+
+    def __init__(
+        self, llm_provider: LLMProvider, llm_cache: Optional[SemanticLLMCache] = None
+    ):
         self.llm_provider = llm_provider
-        self.embeddings = OllamaEmbeddings(
-            base_url=llm_provider.llm.base_url, model=llm_provider.llm.model
-        )
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000, chunk_overlap=200
+        self.llm_cache = llm_cache
+        settings = get_settings()
+        self.embeddings = CachedEmbeddings(
+            BatchedOllamaEmbeddings(
+                base_url=llm_provider.llm.base_url,
+                model=llm_provider.llm.model,
+                batch_size=settings.OLLAMA_EMBED_BATCH,
+                client_kwargs={"timeout": settings.OLLAMA_EMBED_TIMEOUT},
+            ),
+            cache_dir=settings.EMBEDDING_CACHE_DIR,
+            namespace=llm_provider.llm.model,
+            max_bytes=settings.EMBEDDING_CACHE_MAX_BYTES,
         )
+        self.text_splitter = TEXT_SPLITTER
 
-    async def process_document(self, pages: List[Document]) -> DocumentMetadata:
+    async def process_document(
+        self, pages: List[Document], split_pool: Optional[Executor] = None
+    ) -> DocumentMetadata:
         """
         Process a PDF document using embeddings for better analysis of larger documents.
         Returns extended metadata including title and both full and short summaries.
+        Large documents are split into chunks in split_pool when one is given.
         """
-        all_text_chunks = []
-        for page in pages:
-            all_text_chunks.extend(self.text_splitter.split_text(page.page_content))
-
-        vectorstore = FAISS.from_texts(texts=all_text_chunks, embedding=self.embeddings)
+        all_text_chunks = await asyncio.to_thread(self._split_pages, pages, split_pool)
+        all_text_chunks = self._deduplicate_chunks(all_text_chunks)
+
+        if len(all_text_chunks) <= get_settings().SMALL_DOCUMENT_CHUNKS:
+            # Small documents fit into the prompt completely, so retrieval is skipped
+            combined_text = "\n".join(all_text_chunks)
+            contexts = [combined_text] * len(self.RETRIEVAL_QUERIES)
+        else:
+            # Embedding and index construction block, so they run in a worker thread
+            contexts = await asyncio.to_thread(
+                self._retrieve_contexts, all_text_chunks
+            )
+        title_text, summary_text, short_summary_text, tags_text = contexts
 
         # Generate all metadata in parallel for better performance
-        title = await self._generate_title(vectorstore)
-        summary = await self._generate_summary(vectorstore)
-        short_summary = await self._generate_short_summary(vectorstore)
-        tags = await self._generate_tags(vectorstore)
+        title, summary, short_summary, tags = await asyncio.gather(
+            self._generate_title(title_text),
+            self._generate_summary(summary_text),
+            self._generate_short_summary(short_summary_text),
+            self._generate_tags(tags_text),
+        )
 
         return DocumentMetadata(
             title=title, summary=summary, short_summary=short_summary, tags=tags
         )
 
-    async def _generate_title(self, vectorstore: FAISS) -> str:
+    def _split_pages(
+        self, pages: List[Document], split_pool: Optional[Executor]
+    ) -> List[str]:
         """
-        Generate a descriptive title for the document.
+        Split the pages into text chunks, using the process pool for large documents.
+        """
+        if split_pool is None or len(pages) <= PARALLEL_SPLIT_MIN_PAGES:
+            return [
+                chunk.page_content
+                for chunk in self.text_splitter.split_documents(pages)
+            ]
+
+        chunked_pages = split_pool.map(
+            self.text_splitter.split_text,
+            (page.page_content for page in pages),
+            chunksize=8,
+        )
+        return list(itertools.chain.from_iterable(chunked_pages))
+
+    @staticmethod
+    def _deduplicate_chunks(text_chunks: List[str]) -> List[str]:
+        """
+        Drop repeated chunks such as headers, footers or boilerplate while keeping the original order.
+        """
+        seen = set()
+        unique_chunks = []
+        for chunk in text_chunks:
+            digest = hashlib.blake2b(chunk.encode(), digest_size=16).digest()
+            if digest not in seen:
+                seen.add(digest)
+                unique_chunks.append(chunk)
+        return unique_chunks
+
+    def _retrieve_contexts(self, text_chunks: List[str]) -> List[str]:
+        """
+        Index the chunks and retrieve the relevant ones for all metadata queries with a single embedding call and index search.
         """
-        query = "Was ist der Haupttitel oder das Hauptthema dieses Dokuments?"
-        relevant_chunks = vectorstore.similarity_search(query, k=2)
-        combined_text = "\n".join(doc.page_content for doc in relevant_chunks)
+        chunk_vectors = np.asarray(
+            self.embeddings.embed_documents(text_chunks), dtype=np.float32
+        )
+        # 8-bit scalar quantization is precise enough to pick the top chunks
+        index = faiss.IndexScalarQuantizer(
+            chunk_vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2
+        )
+        try:
+            index.train(chunk_vectors)
+            index.add(chunk_vectors)
+            del chunk_vectors
+
+            queries = [query for query, _ in self.RETRIEVAL_QUERIES]
+            query_vectors = np.asarray(
+                self.embeddings.embed_documents(queries), dtype=np.float32
+            )
+            max_k = max(k for _, k in self.RETRIEVAL_QUERIES)
+            _, indices = index.search(query_vectors, max_k)
+        finally:
+            # Free the vectors right away, even if a traceback keeps this frame alive
+            index.reset()
+
+        chunks = np.array(text_chunks, dtype=object)
+        contexts = []
+        for row, (_, k) in zip(indices, self.RETRIEVAL_QUERIES):
+            ids = row[:k]
+            contexts.append("\n".join(chunks[ids[ids != -1]]))
+        return contexts
+
+    async def _generate(self, kind: str, combined_text: str, prompt: str) -> str:
+        """
+        Generate a response for the prompt, reusing a cached answer for the same kind of prompt on near-identical text.
+        """
+        if self.llm_cache is None or not self.llm_cache.accepts(combined_text):
+            return await self.llm_provider.generate(prompt)
+
+        vector = await self.llm_cache.embed(combined_text)
+        cached = await self.llm_cache.lookup(kind, vector)
+        if cached is not None:
+            return cached
+
+        response = await self.llm_provider.generate(prompt)
+        await self.llm_cache.add(kind, vector, response)
+        return response
 
+    async def _generate_title(self, combined_text: str) -> str:
+        """
+        Generate a descriptive title for the document.
+        """
         prompt = f"""
         Du bist ein erfahrener Dokumentenanalytiker. Analysiere den folgenden Textauszug und erzeuge einen prägnanten und relevanten Titel für das Dokument.
 
@@ -60,20 +186,16 @@ class PDFAnalysisPipeline:
         - Der Titel muss ohne Einleitung, zusätzliche Texte oder Erklärungen sein.
         """
 
-        title = await self.llm_provider.generate(prompt)
+        title = await self._generate("title", combined_text, prompt)
         # Remove leading/trailing whitespace and special characters
         clean_title = re.sub(r"[^\w\s]", "", title.strip())
 
         return clean_title
 
-    async def _generate_summary(self, vectorstore: FAISS) -> str:
+    async def _generate_summary(self, combined_text: str) -> str:
         """
         Generate a detailed summary identifying the document type and its main points.
         """
-        query = "Was sind die wichtigsten Inhalte und Hauptpunkte des Dokuments?"
-        relevant_chunks = vectorstore.similarity_search(query, k=5)
-        combined_text = "\n".join(doc.page_content for doc in relevant_chunks)
-
         prompt = f"""
         Du bist ein Experte für Inhaltszusammenfassungen. Erstelle auf Basis der folgenden Textabschnitte eine umfassende Zusammenfassung des Dokuments.
 
@@ -86,16 +208,12 @@ class PDFAnalysisPipeline:
         - Gib nur die Zusammenfassung ohne zusätzliche Erklärungen oder Einleitungen zurück.
         """
 
-        return await self.llm_provider.generate(prompt)
+        return await self._generate("summary", combined_text, prompt)
 
-    async def _generate_short_summary(self, vectorstore: FAISS) -> str:
+    async def _generate_short_summary(self, combined_text: str) -> str:
         """
         Generate a concise summary (2-3 sentences) of the document's key points.
         """
-        query = "Was sind die absolut wichtigsten Kernaussagen?"
-        relevant_chunks = vectorstore.similarity_search(query, k=3)
-        combined_text = "\n".join(doc.page_content for doc in relevant_chunks)
-
         prompt = f"""
         Erstelle eine kurze Zusammenfassung der zentralen Inhalte auf Basis der folgenden Textauszüge.
 
@@ -107,16 +225,12 @@ class PDFAnalysisPipeline:
         - Gib nur die Zusammenfassung zurück, ohne Einleitungen, Anmerkungen oder weitere Erklärungen.
         """
 
-        return await self.llm_provider.generate(prompt)
+        return await self._generate("short_summary", combined_text, prompt)
 
-    async def _generate_tags(self, vectorstore: FAISS) -> List[str]:
+    async def _generate_tags(self, combined_text: str) -> List[str]:
         """
         Generate relevant tags based on document content.
         """
-        query = "Was sind die Hauptthemen und -inhalte?"
-        relevant_chunks = vectorstore.similarity_search(query, k=3)
-        combined_text = "\n".join([doc.page_content for doc in relevant_chunks])
-
         prompt = f"""
         Basierend auf den folgenden Textabschnitten, erzeuge eine Liste relevanter Schlagwörter, die die Hauptthemen und Inhalte des Dokuments beschreiben.
 
@@ -128,6 +242,6 @@ class PDFAnalysisPipeline:
         - Die Ausgabe soll nur die Schlagwörter enthalten, ohne Einleitungen, Erklärungen oder andere Texte.
         """
 
-        tags_text = await self.llm_provider.generate(prompt)
+        tags_text = await self._generate("tags", combined_text, prompt)
         tags_text = tags_text.split("\n")[-1]  # Only take the last part of the output
         return [tag.strip() for tag in tags_text.split(",")]
@@ -0,0 +1,188 @@
+import hashlib
+import os
+import threading
+import uuid
+from typing import List, Optional
+
+import httpx
+import numpy as np
+import ollama
+from langchain_core.embeddings import Embeddings
+from langchain_ollama import OllamaEmbeddings
+from pydantic import PrivateAttr
+
+
+def _is_retryable(error: Exception) -> bool:
+    # Timeouts and server errors can be caused by a batch being too large for Ollama
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, httpx.TimeoutException)
+
+
+class BatchedOllamaEmbeddings(OllamaEmbeddings):
+    """
+    OllamaEmbeddings that sends documents to /api/embed in batches. The batch size
+    is halved when Ollama times out or fails with a server error and grows back
+    after consecutive successful batches, up to the configured maximum. The
+    current size is shared by all calls on the instance.
+    """
+
+    batch_size: int = 32
+    # Consecutive successful batches before the batch size is doubled again
+    grow_after: int = 4
+
+    _current_batch_size: int = PrivateAttr(default=0)
+    _successes: int = PrivateAttr(default=0)
+    _batch_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        start = 0
+        while start < len(texts):
+            batch = texts[start : start + self._get_batch_size()]
+            try:
+                response = self._client.embed(self.model, batch)
+            except (ollama.ResponseError, httpx.TimeoutException) as e:
+                if len(batch) == 1 or not _is_retryable(e):
+                    raise
+                self._shrink(len(batch))
+                continue
+
+            embeddings.extend(response["embeddings"])
+            start += len(batch)
+            self._grow()
+        return embeddings
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        start = 0
+        while start < len(texts):
+            batch = texts[start : start + self._get_batch_size()]
+            try:
+                response = await self._async_client.embed(self.model, batch)
+            except (ollama.ResponseError, httpx.TimeoutException) as e:
+                if len(batch) == 1 or not _is_retryable(e):
+                    raise
+                self._shrink(len(batch))
+                continue
+
+            embeddings.extend(response["embeddings"])
+            start += len(batch)
+            self._grow()
+        return embeddings
+
+    def _get_batch_size(self) -> int:
+        with self._batch_lock:
+            if not self._current_batch_size:
+                self._current_batch_size = self.batch_size
+            return self._current_batch_size
+
+    def _shrink(self, failed_size: int) -> None:
+        with self._batch_lock:
+            self._current_batch_size = max(
+                1, min(self._current_batch_size, failed_size // 2)
+            )
+            self._successes = 0
+
+    def _grow(self) -> None:
+        with self._batch_lock:
+            self._successes += 1
+            if (
+                self._successes >= self.grow_after
+                and self._current_batch_size < self.batch_size
+            ):
+                self._current_batch_size = min(
+                    self._current_batch_size * 2, self.batch_size
+                )
+                self._successes = 0
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings adapter that stores document vectors on disk, keyed by the
+    SHA-256 of model and text, so only unseen chunks reach the underlying model.
+    Once the directory exceeds max_bytes, the least recently used files are removed.
+    """
+
+    def __init__(
+        self, underlying: Embeddings, cache_dir: str, namespace: str, max_bytes: int
+    ):
+        self.underlying = underlying
+        self.cache_dir = cache_dir
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        # embed_documents runs in worker threads, which share the size estimate
+        self._lock = threading.Lock()
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    def _path(self, text: str) -> str:
+        key = hashlib.sha256(f"{self.namespace}|{text}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.npy")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        paths = [self._path(text) for text in texts]
+        embeddings: List[Optional[List[float]]] = []
+        missing = []
+        for i, path in enumerate(paths):
+            try:
+                embeddings.append(np.load(path).tolist())
+                # The modification time marks the last use for eviction
+                os.utime(path)
+            except (OSError, ValueError):
+                embeddings.append(None)
+                missing.append(i)
+
+        if missing:
+            vectors = self.underlying.embed_documents([texts[i] for i in missing])
+            written = 0
+            for i, vector in zip(missing, vectors):
+                embeddings[i] = vector
+                written += self._save(paths[i], vector)
+            self._account(written)
+
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    def _entries(self) -> List[os.DirEntry]:
+        with os.scandir(self.cache_dir) as entries:
+            return [entry for entry in entries if entry.name.endswith(".npy")]
+
+    def _account(self, written: int) -> None:
+        with self._lock:
+            self._size += written
+            if self._size <= self.max_bytes:
+                return
+
+            # Rescan, since other workers may share the directory, then remove the
+            # least recently used files until the cache is back under 90% of the limit
+            files = []
+            for entry in self._entries():
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+            files.sort()
+
+            self._size = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if self._size <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._size -= size
+
+    @staticmethod
+    def _save(path: str, vector: List[float]) -> int:
+        # Write to a temporary name first so concurrent readers never see a partial file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, np.asarray(vector, dtype=np.float32))
+            size = f.tell()
+        os.replace(tmp_path, path)
+        return size
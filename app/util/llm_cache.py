@@ -0,0 +1,119 @@
+import asyncio
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class SemanticLLMCache:
+    """
+    Cache for LLM responses keyed by the embedding of the document text a prompt
+    was built from, separately for each kind of prompt. A stored response is
+    reused when the nearest cached text lies within the squared L2 distance
+    threshold. Entries are persisted in SQLite, capped at max_entries per kind,
+    and loaded back into FAISS indexes on startup.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        path: str,
+        namespace: str,
+        threshold: float,
+        max_entries: int,
+        max_chars: int,
+    ):
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.indexes: Dict[str, faiss.IndexFlatL2] = {}
+        self.responses: Dict[str, List[str]] = {}
+        # Lookups and inserts run in worker threads and share the index and connection
+        self._lock = threading.Lock()
+
+        # The cache is created at startup but used from worker threads
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache (namespace TEXT NOT NULL, "
+            "kind TEXT NOT NULL, embedding BLOB NOT NULL, response TEXT NOT NULL)"
+        )
+        rows = self.connection.execute(
+            "SELECT kind, embedding, response FROM ("
+            "SELECT rowid, kind, embedding, response, ROW_NUMBER() OVER "
+            "(PARTITION BY kind ORDER BY rowid DESC) AS age "
+            "FROM llm_cache WHERE namespace = ?"
+            ") WHERE age <= ? ORDER BY rowid",
+            (namespace, max_entries),
+        ).fetchall()
+        for kind, embedding, response in rows:
+            self._add(kind, np.frombuffer(embedding, dtype=np.float32), response)
+        with self.connection:
+            for kind in self.indexes:
+                self._evict_rows(kind, self.max_entries)
+
+    def accepts(self, text: str) -> bool:
+        # Longer texts would be truncated by the embedding model, so different
+        # documents sharing the same beginning could collide
+        return len(text) <= self.max_chars
+
+    async def embed(self, text: str) -> np.ndarray:
+        return np.asarray(await self.embeddings.aembed_query(text), dtype=np.float32)
+
+    async def lookup(self, kind: str, vector: np.ndarray) -> Optional[str]:
+        return await asyncio.to_thread(self._lookup, kind, vector)
+
+    async def add(self, kind: str, vector: np.ndarray, response: str) -> None:
+        await asyncio.to_thread(self._store, kind, vector, response)
+
+    def _lookup(self, kind: str, vector: np.ndarray) -> Optional[str]:
+        with self._lock:
+            index = self.indexes.get(kind)
+            if index is None or index.ntotal == 0:
+                return None
+
+            distances, ids = index.search(vector.reshape(1, -1), 1)
+            if distances[0][0] < self.threshold:
+                return self.responses[kind][ids[0][0]]
+            return None
+
+    def _store(self, kind: str, vector: np.ndarray, response: str) -> None:
+        with self._lock:
+            self._add(kind, vector, response)
+            index = self.indexes[kind]
+            evict = index.ntotal > self.max_entries
+            if evict:
+                # Drop the oldest tenth at once, since every removal from a flat
+                # index copies all remaining vectors. Entries are kept in insertion
+                # order, so the oldest ones are at the front.
+                count = index.ntotal - self.max_entries + max(1, self.max_entries // 10)
+                index.remove_ids(np.arange(count, dtype=np.int64))
+                del self.responses[kind][:count]
+
+            with self.connection:
+                self.connection.execute(
+                    "INSERT INTO llm_cache (namespace, kind, embedding, response) "
+                    "VALUES (?, ?, ?, ?)",
+                    (self.namespace, kind, vector.tobytes(), response),
+                )
+                if evict:
+                    self._evict_rows(kind, index.ntotal)
+
+    def _add(self, kind: str, vector: np.ndarray, response: str) -> None:
+        if kind not in self.indexes:
+            self.indexes[kind] = faiss.IndexFlatL2(vector.shape[0])
+            self.responses[kind] = []
+        self.indexes[kind].add(vector.reshape(1, -1))
+        self.responses[kind].append(response)
+
+    def _evict_rows(self, kind: str, keep: int) -> None:
+        self.connection.execute(
+            "DELETE FROM llm_cache WHERE rowid IN ("
+            "SELECT rowid FROM llm_cache WHERE namespace = ? AND kind = ? "
+            "ORDER BY rowid DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, kind, keep),
+        )
@@ -15,7 +15,7 @@ class OllamaProvider(LLMProvider):
         self.llm = OllamaLLM(base_url=base_url, model=model)
 
     async def generate(self, prompt: str) -> str:
-        return self.llm.invoke(prompt)
+        return await self.llm.ainvoke(prompt)
 
 
 class LLMFactory:
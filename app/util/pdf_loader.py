@@ -0,0 +1,18 @@
+from typing import List
+
+import pymupdf
+from langchain.docstore.document import Document
+
+
+def load_pdf(path: str) -> List[Document]:
+    """
+    Extract the text of every page of a PDF file into a Document.
+    """
+    with pymupdf.open(path) as pdf:
+        return [
+            Document(
+                page_content=page.get_text("text"),
+                metadata={"source": path, "page": page_number},
+            )
+            for page_number, page in enumerate(pdf)
+        ]